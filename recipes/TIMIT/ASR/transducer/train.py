@@ -15,13 +15,17 @@ Authors
  * Mirco Ravanelli 2020
  * Ju-Chieh Chou 2020
 """
+import collections
+import functools
 import logging
 import os
 import sys
 
+import torch
 from hyperpyyaml import load_hyperpyyaml
 
 import speechbrain as sb
+from speechbrain.utils.callchains import lengths_arg_exists
 from speechbrain.utils.distributed import run_on_main
 
 logger = logging.getLogger(__name__)
@@ -29,19 +33,42 @@ logger = logging.getLogger(__name__)
 
 # Define training procedure
 class ASR_Brain(sb.Brain):
+    def __init__(
+        self,
+        modules=None,
+        opt_class=None,
+        hparams=None,
+        run_opts=None,
+        checkpointer=None,
+    ):
+        super().__init__(
+            modules=modules,
+            opt_class=opt_class,
+            hparams=hparams,
+            run_opts=run_opts,
+            checkpointer=checkpointer,
+        )
+
+        # CUDA graphs of the feature extraction, indexed by input shape and
+        # ordered from the least to the most recently used
+        self.feats_graphs = collections.OrderedDict()
+
+        # The stock RNNs of SpeechBrain (RNN, LSTM, GRU) accept the lengths
+        # of the sequences and skip the padded steps.
+        self.dec_takes_lengths = lengths_arg_exists(self.hparams.dec.forward)
+
     def compute_forward(self, batch, stage):
         "Given an input batch it computes the phoneme probabilities."
-        batch = batch.to(self.device)
+        batch = batch.to(self.device, non_blocking=True)
         wavs, wav_lens = batch.sig
         phns, phn_lens = batch.phn_encoded
 
         # Add waveform augmentation if specified.
         if stage == sb.Stage.TRAIN and hasattr(self.hparams, "wav_augment"):
             wavs, wav_lens = self.hparams.wav_augment(wavs, wav_lens)
-            phns = self.hparams.wav_augment.replicate_labels(phns)
 
         # Model computations
-        feats = self.hparams.compute_features(wavs)
+        feats = self.compute_feats(wavs)
         feats = self.modules.normalize(feats, wav_lens)
         x = self.modules.enc(feats)
         x = self.modules.enc_lin(x)
@@ -51,9 +78,25 @@ class ASR_Brain(sb.Brain):
             phns, self.hparams.blank_index
         )
         e_in = self.modules.emb(y_in)
-        h, _ = self.modules.dec(e_in)
+        if self.dec_takes_lengths:
+            # Relative lengths of the label sequences, bos token included
+            n_labels = phns.shape[1]
+            y_lens = ((phn_lens * n_labels).round() + 1) / (n_labels + 1)
+            h, _ = self.modules.dec(e_in, lengths=y_lens)
+        else:
+            h, _ = self.modules.dec(e_in)
         h = self.modules.dec_lin(h)
 
+        # The augmented copies share the same labels: the prediction network
+        # is run once on the original batch and its output is replicated.
+        if stage == sb.Stage.TRAIN and hasattr(self.hparams, "wav_augment"):
+            h = self.hparams.wav_augment.replicate_labels(h)
+
+        # With the pruned loss, the joint network is only evaluated on the
+        # pruned lattice inside compute_objectives.
+        if stage == sb.Stage.TRAIN and self.hparams.pruned_loss:
+            return x, h, wav_lens
+
         # Joint network
         # add labelseq_dim to the encoder tensor: [B,T,H_enc] => [B,T,1,H_enc]
         # add timeseq_dim to the decoder tensor: [B,U,H_dec] => [B,1,U,H_dec]
@@ -76,21 +119,82 @@ class ASR_Brain(sb.Brain):
             return logits, wav_lens, best_hyps
         return logits, wav_lens
 
+    def compute_feats(self, wavs):
+        """Computes the features, replaying a CUDA graph when enabled.
+
+        The waveforms are zero-padded to a multiple of `feats_graph_bucket`
+        samples, so that the graph captured for a (batch, length) shape is
+        reused by many batches. The frames computed on the padding are then
+        removed. Each graph holds its own memory pool, so at most
+        `feats_graph_cache_size` graphs are kept, and the least recently
+        used one is released when a new shape is captured.
+        """
+        if not (self.hparams.feats_cuda_graph and wavs.is_cuda):
+            return self.hparams.compute_features(wavs)
+
+        bucket = self.hparams.feats_graph_bucket
+        wav_len = wavs.shape[1]
+        bucket_len = -(-wav_len // bucket) * bucket
+        key = (wavs.shape[0], bucket_len)
+
+        if key in self.feats_graphs:
+            self.feats_graphs.move_to_end(key)
+        else:
+            if len(self.feats_graphs) >= self.hparams.feats_graph_cache_size:
+                self.feats_graphs.popitem(last=False)
+            static_wavs = torch.zeros(key, device=wavs.device)
+            try:
+                # Warm-up on a side stream before capturing
+                stream = torch.cuda.Stream()
+                stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(stream):
+                    self.hparams.compute_features(static_wavs)
+                torch.cuda.current_stream().wait_stream(stream)
+
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph):
+                    static_feats = self.hparams.compute_features(static_wavs)
+            except RuntimeError as e:
+                logger.warning(
+                    "Cannot capture the feature extraction in a CUDA graph "
+                    f"({e}). Computing the features eagerly."
+                )
+                self.hparams.feats_cuda_graph = False
+                return self.hparams.compute_features(wavs)
+            self.feats_graphs[key] = (graph, static_wavs, static_feats)
+
+        graph, static_wavs, static_feats = self.feats_graphs[key]
+        static_wavs[:, :wav_len].copy_(wavs)
+        static_wavs[:, wav_len:].zero_()
+        graph.replay()
+
+        # Frames of the (centered) STFT of the original waveforms
+        filter_props = self.hparams.compute_features.get_filter_properties()
+        return static_feats[:, : wav_len // filter_props.stride + 1].clone()
+
     def compute_objectives(self, predictions, batch, stage):
         "Given the network predictions and targets computed the loss."
         ids = batch.id
         phns, phn_lens = batch.phn_encoded
 
         if stage == sb.Stage.TRAIN and hasattr(self.hparams, "wav_augment"):
-            phns = self.hparams.wav_augment.replicate_labels(phns)
-            phn_lens = self.hparams.wav_augment.replicate_labels(phn_lens)
+            phns, phn_lens = self.hparams.wav_augment.replicate_multiple_labels(
+                phns, phn_lens
+            )
+
+        if stage == sb.Stage.TRAIN and self.hparams.pruned_loss:
+            x, h, wav_lens = predictions
+            return self.compute_pruned_cost(x, h, phns, wav_lens, phn_lens)
 
         if stage == sb.Stage.TRAIN:
             predictions, wav_lens = predictions
         else:
             predictions, wav_lens, hyps = predictions
 
-        # Transducer loss use logits from RNN-T model.
+        # Transducer loss use logits from RNN-T model. The loss and the
+        # metrics are always computed in float32, as the autocast casts of
+        # the loss only apply on CUDA.
+        predictions = predictions.float()
         loss = self.hparams.compute_cost(predictions, phns, wav_lens, phn_lens)
         self.transducer_metrics.append(
             ids, predictions, phns, wav_lens, phn_lens
@@ -98,11 +202,74 @@ class ASR_Brain(sb.Brain):
 
         if stage != sb.Stage.TRAIN:
             self.per_metrics.append(
-                ids, hyps, phns, None, phn_lens, self.label_encoder.decode_ndim
+                ids, hyps, phns, None, phn_lens, self.decode_batch
             )
 
         return loss
 
+    def compute_pruned_cost(self, x, h, phns, wav_lens, phn_lens):
+        """Computes the pruned transducer loss.
+
+        A cheap additive joiner is first used to find, for every frame, the
+        `prune_range` labels carrying most of the probability mass. The full
+        joint network is then evaluated on this pruned lattice only, i.e., on
+        a [B, T, prune_range, V] tensor instead of [B, T, U, V].
+
+        Reference: https://arxiv.org/abs/2206.13236
+        """
+        try:
+            import fast_rnnt
+        except ImportError:
+            err_msg = "The pruned transducer loss requires fast_rnnt.\n"
+            err_msg += "To use it, please run `pip install fast_rnnt`\n"
+            err_msg += "Otherwise, set `pruned_loss: False` in the yaml file."
+            raise ImportError(err_msg)
+
+        # boundary: [0, 0, U_i, T_i] for each sentence of the batch
+        symbols = phns.long()
+        boundary = torch.zeros(
+            (x.shape[0], 4), dtype=torch.int64, device=x.device
+        )
+        boundary[:, 2] = (phn_lens * symbols.shape[1]).round().long()
+        boundary[:, 3] = (wav_lens * x.shape[1]).round().long()
+
+        # The simple joiner sums the projections of the encoder and
+        # prediction networks on the output vocabulary.
+        # The losses are always computed in float32, even under autocast.
+        am = self.modules.output(x).float()
+        lm = self.modules.output(h).float()
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            simple_loss, (px_grad, py_grad) = fast_rnnt.rnnt_loss_simple(
+                lm=lm,
+                am=am,
+                symbols=symbols,
+                termination_symbol=self.hparams.blank_index,
+                boundary=boundary,
+                return_grad=True,
+            )
+
+            # Select the labels to keep for each frame and prune the lattice
+            ranges = fast_rnnt.get_rnnt_prune_ranges(
+                px_grad=px_grad,
+                py_grad=py_grad,
+                boundary=boundary,
+                s_range=self.hparams.prune_range,
+            )
+        x_pruned, h_pruned = fast_rnnt.do_rnnt_pruning(
+            am=x, lm=h, ranges=ranges
+        )
+        logits = self.modules.output(self.modules.Tjoint(x_pruned, h_pruned))
+
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            pruned_loss = fast_rnnt.rnnt_loss_pruned(
+                logits=logits.float(),
+                symbols=symbols,
+                ranges=ranges,
+                termination_symbol=self.hparams.blank_index,
+                boundary=boundary,
+            )
+        return self.hparams.simple_loss_scale * simple_loss + pruned_loss
+
     def on_stage_start(self, stage, epoch):
         "Gets called when a stage (either training, validation, test) starts."
         self.transducer_metrics = self.hparams.transducer_stats()
@@ -110,6 +277,15 @@ class ASR_Brain(sb.Brain):
         if stage != sb.Stage.TRAIN:
             self.per_metrics = self.hparams.per_stats()
 
+            # Hypotheses (and targets) often repeat, so the decoded label
+            # sequences are cached for the whole stage.
+            decode_sequence = functools.lru_cache(maxsize=8192)(
+                self.label_encoder.decode_ndim
+            )
+            self.decode_batch = lambda batch: [
+                decode_sequence(tuple(int(x) for x in seq)) for seq in batch
+            ]
+
     def on_stage_end(self, stage, stage_loss, epoch):
         """Gets called at the end of a epoch."""
         if stage == sb.Stage.TRAIN:
@@ -217,12 +393,10 @@ def dataio_prep(hparams):
 
     # 3. Define text pipeline:
     @sb.utils.data_pipeline.takes("phn")
-    @sb.utils.data_pipeline.provides("phn_list", "phn_encoded")
+    @sb.utils.data_pipeline.provides("phn_list")
     def text_pipeline(phn):
         phn_list = phn.strip().split()
-        yield phn_list
-        phn_encoded = label_encoder.encode_sequence_torch(phn_list)
-        yield phn_encoded
+        return phn_list
 
     sb.dataio.dataset.add_dynamic_item(datasets, text_pipeline)
 
@@ -237,10 +411,45 @@ def dataio_prep(hparams):
         sequence_input=True,
     )
 
-    # 4. Set output:
+    # 4. Encode the phonemes once, so that the dataloader workers only have to
+    # look them up.
+    phn_encoded_cache = {}
+    for dataset in datasets:
+        with dataset.output_keys_as(["id", "phn_list"]):
+            for data_point in dataset:
+                phn_encoded = label_encoder.encode_sequence_torch(
+                    data_point["phn_list"]
+                )
+                phn_encoded_cache[data_point["id"]] = phn_encoded
+
+    @sb.utils.data_pipeline.takes("id")
+    @sb.utils.data_pipeline.provides("phn_encoded")
+    def phn_encoded_pipeline(uid):
+        return phn_encoded_cache[uid]
+
+    sb.dataio.dataset.add_dynamic_item(datasets, phn_encoded_pipeline)
+
+    # 5. Set output:
     sb.dataio.dataset.set_output_keys(datasets, ["id", "sig", "phn_encoded"])
 
-    return train_data, valid_data, test_data, label_encoder
+    # 6. If Dynamic Batching is used, we instantiate the train sampler.
+    # Batches are filled up to a total duration instead of a fixed number of
+    # sentences, which reduces the padding of each batch.
+    train_batch_sampler = None
+    if hparams["dynamic_batching"]:
+        from speechbrain.dataio.sampler import DynamicBatchSampler  # noqa
+
+        dynamic_hparams = hparams["dynamic_batch_sampler"]
+        train_batch_sampler = DynamicBatchSampler(
+            train_data,
+            dynamic_hparams["max_batch_len"],
+            num_buckets=dynamic_hparams["num_buckets"],
+            length_func=lambda x: float(x["duration"]),
+            shuffle=dynamic_hparams["shuffle_ex"],
+            batch_ordering=dynamic_hparams["batch_ordering"],
+        )
+
+    return train_data, valid_data, test_data, label_encoder, train_batch_sampler
 
 
 # Begin Recipe!
@@ -280,7 +489,13 @@ if __name__ == "__main__":
     run_on_main(hparams["prepare_noise_data"])
 
     # Dataset IO prep: creating Dataset objects and proper encodings for phones
-    train_data, valid_data, test_data, label_encoder = dataio_prep(hparams)
+    (
+        train_data,
+        valid_data,
+        test_data,
+        label_encoder,
+        train_bsampler,
+    ) = dataio_prep(hparams)
 
     # Trainer initialization
     asr_brain = ASR_Brain(
@@ -292,18 +507,42 @@ if __name__ == "__main__":
     )
     asr_brain.label_encoder = label_encoder
 
+    train_dataloader_opts = hparams["train_dataloader_opts"]
+    valid_dataloader_opts = hparams["valid_dataloader_opts"]
+    test_dataloader_opts = hparams["test_dataloader_opts"]
+
+    if train_bsampler is not None:
+        train_dataloader_opts = {
+            "batch_sampler": train_bsampler,
+            "num_workers": hparams["num_workers"],
+            "pin_memory": train_dataloader_opts.get("pin_memory", False),
+        }
+
+    # Keep the workers alive across epochs and let them prefetch batches, with
+    # the same options for the train, valid and test loaders
+    if hparams["num_workers"] > 0:
+        for loader_opts in [
+            train_dataloader_opts,
+            valid_dataloader_opts,
+            test_dataloader_opts,
+        ]:
+            loader_opts.setdefault("persistent_workers", True)
+            loader_opts.setdefault(
+                "prefetch_factor", hparams["prefetch_factor"]
+            )
+
     # Training/validation loop
     asr_brain.fit(
         asr_brain.hparams.epoch_counter,
         train_data,
         valid_data,
-        train_loader_kwargs=hparams["train_dataloader_opts"],
-        valid_loader_kwargs=hparams["valid_dataloader_opts"],
+        train_loader_kwargs=train_dataloader_opts,
+        valid_loader_kwargs=valid_dataloader_opts,
     )
 
     # Test
     asr_brain.evaluate(
         test_data,
         min_key="PER",
-        test_loader_kwargs=hparams["test_dataloader_opts"],
+        test_loader_kwargs=test_dataloader_opts,
     )
@@ -4,11 +4,11 @@ Authors
  * Mirco Ravanelli 2022
 """
 
+import contextlib
 import logging
 import random
 
 import torch
-import torch.nn.functional as F
 
 from speechbrain.utils.callchains import lengths_arg_exists
 
@@ -41,16 +41,16 @@ class Augmenter(torch.nn.Module):
     min_augmentations: int
         The number of augmentations applied to the input signal is randomly
         sampled between min_augmentations and max_augmentations. For instance,
-        if the augmentation dict contains N=6 augmentations and we set
+        if the augmentation list contains N=6 augmentations and we set
         select min_augmentations=1 and max_augmentations=4 we apply up to
         M=4 augmentations. The selected augmentations are applied in the order
-        specified in the augmentations dict. If shuffle_augmentations = True,
+        specified in the augmentations list. If shuffle_augmentations = True,
         a random set of M augmentations is selected.
     max_augmentations: int
         Maximum number of augmentations to apply. See min_augmentations for
         more details.
     shuffle_augmentations:  bool
-        If True, it shuffles the entries of the augmentations dictionary.
+        If True, it shuffles the entries of the augmentations list.
         The effect is to randomply select the order of the augmentations
         to apply.
     repeat_augment: int
@@ -175,11 +175,8 @@ class Augmenter(torch.nn.Module):
                 if enabled
             ]
 
-        # Turn augmentations into a dictionary
-        self.augmentations = {
-            augmentation.__class__.__name__ + str(i): augmentation
-            for i, augmentation in enumerate(augmentations)
-        }
+        # Register the augmentations as submodules, indexed by position
+        self.augmentations = torch.nn.ModuleList(augmentations)
 
         if len(self.augmentations) == 0:
             logger.warning(
@@ -203,9 +200,13 @@ class Augmenter(torch.nn.Module):
             self.max_augmentations = self.min_augmentations
 
         # Check if augmentation modules need the length argument
-        self.require_lengths = {}
-        for aug_key, aug_fun in self.augmentations.items():
-            self.require_lengths[aug_key] = lengths_arg_exists(aug_fun.forward)
+        self.require_lengths = [
+            lengths_arg_exists(aug_fun.forward)
+            for aug_fun in self.augmentations
+        ]
+
+        # CUDA streams for the parallel augmentations, created when needed
+        self.cuda_streams = {}
 
     def augment(self, x, lengths, selected_augmentations):
         """Applies data augmentation on the selected augmentations.
@@ -216,8 +217,8 @@ class Augmenter(torch.nn.Module):
             input to augment.
         lengths : torch.Tensor
             The length of each sequence in the batch.
-        selected_augmentations: dict
-            Dictionary containing the selected augmentation to apply.
+        selected_augmentations: list
+            Indices of the selected augmentations to apply.
 
         Returns
         -------
@@ -230,44 +231,85 @@ class Augmenter(torch.nn.Module):
         next_lengths = lengths
         output = []
         output_lengths = []
-        out_lengths = lengths
-        for k, augment_name in enumerate(selected_augmentations):
-            augment_fun = self.augmentations[augment_name]
-
-            idx = torch.arange(x.shape[0])
-            if self.parallel_augment and self.parallel_augment_fixed_bs:
-                idx_startstop = torch.linspace(
-                    0, x.shape[0], len(selected_augmentations) + 1
-                ).to(torch.int)
-                idx_start = idx_startstop[k]
-                idx_stop = idx_startstop[k + 1]
-                idx = idx[idx_start:idx_stop]
-
-            # Check input arguments
-            if self.require_lengths[augment_name]:
-                out = augment_fun(
-                    next_input[idx, ...], lengths=next_lengths[idx]
-                )
+
+        # Batch boundaries of the examples processed by each augmentation,
+        # computed once on the host.
+        fixed_bs = self.parallel_augment and self.parallel_augment_fixed_bs
+        if fixed_bs:
+            n_aug = len(selected_augmentations)
+            idx_startstop = [k * x.shape[0] // n_aug for k in range(n_aug + 1)]
+
+        # The parallel augmentations are independent: on GPU, each one runs
+        # on its own CUDA stream so that their kernels can overlap.
+        use_streams = (
+            self.parallel_augment
+            and x.is_cuda
+            and len(selected_augmentations) > 1
+        )
+        if use_streams:
+            main_stream = torch.cuda.current_stream(x.device)
+            streams = self.get_cuda_streams(
+                x.device, len(selected_augmentations)
+            )
+
+        for k, augment_idx in enumerate(selected_augmentations):
+            augment_fun = self.augmentations[augment_idx]
+
+            if use_streams:
+                streams[k].wait_stream(main_stream)
+                stream_context = torch.cuda.stream(streams[k])
             else:
-                out = augment_fun(next_input[idx, ...])
+                stream_context = contextlib.nullcontext()
+
+            with stream_context:
+                # Some augmentations work in-place, so they are given a copy
+                # of the input. In the sequential pipeline, only the first one
+                # reads the original input.
+                if fixed_bs:
+                    idx_start = idx_startstop[k]
+                    idx_stop = idx_startstop[k + 1]
+                    aug_input = next_input[idx_start:idx_stop].clone()
+                    aug_lengths = next_lengths[idx_start:idx_stop]
+                elif self.parallel_augment or k == 0:
+                    aug_input = next_input.clone()
+                    aug_lengths = next_lengths
+                else:
+                    aug_input = next_input
+                    aug_lengths = next_lengths
 
-            # Check output arguments
-            if isinstance(out, tuple):
-                if len(out) == 2:
-                    out, out_lengths = out
+                # Check input arguments
+                if self.require_lengths[augment_idx]:
+                    out = augment_fun(aug_input, lengths=aug_lengths)
                 else:
-                    raise ValueError(
-                        "The function must return max two arguments (Tensor, Length[optional])"
-                    )
+                    out = augment_fun(aug_input)
+
+                # Check output arguments
+                out_lengths = aug_lengths
+                if isinstance(out, tuple):
+                    if len(out) == 2:
+                        out, out_lengths = out
+                    else:
+                        raise ValueError(
+                            "The function must return max two arguments (Tensor, Length[optional])"
+                        )
+
+            # The outputs allocated on a side stream are used on the main one
+            if use_streams:
+                out.record_stream(main_stream)
+                out_lengths.record_stream(main_stream)
 
             # Manage sequential or parallel augmentation
             if not self.parallel_augment:
                 next_input = out
-                next_lengths = out_lengths[idx]
+                next_lengths = out_lengths
             else:
                 output.append(out)
                 output_lengths.append(out_lengths)
 
+        if use_streams:
+            for stream in streams:
+                main_stream.wait_stream(stream)
+
         if self.parallel_augment:
             # Concatenate all the augmented data
             output, output_lengths = self.concatenate_outputs(
@@ -298,6 +340,15 @@ class Augmenter(torch.nn.Module):
             The corresponding length of each output.
         """
 
+        # No augmentation, checked before doing any work on the input
+        if (
+            self.repeat_augment == 0
+            or self.max_augmentations <= 0
+            or len(self.augmentations) == 0
+        ):
+            self.do_augment = False
+            return x, lengths
+
         # Determine whether to apply data augmentation
         self.do_augment = True
         if random.random() > self.augment_prob:
@@ -322,26 +373,18 @@ class Augmenter(torch.nn.Module):
             )
             return x, lengths
 
-        # Select the number of augmentations to apply
-        self.N_augment = torch.randint(
-            low=self.min_augmentations,
-            high=self.max_augmentations + 1,
-            size=(1,),
-            device=x.device,
+        # Select the number of augmentations to apply (sampled on the host to
+        # avoid a device synchronization)
+        self.N_augment = random.randint(
+            self.min_augmentations, self.max_augmentations
         )
-
-        # Get augmentations list
-        augmentations_lst = list(self.augmentations.keys())
-
-        # No augmentation
-        if (
-            self.repeat_augment == 0
-            or self.N_augment == 0
-            or len(augmentations_lst) == 0
-        ):
+        if self.N_augment == 0:
             self.do_augment = False
             return x, lengths
 
+        # Get the indices of the augmentations
+        augmentations_lst = list(range(len(self.augmentations)))
+
         # Shuffle augmentation
         if self.shuffle_augmentations:
             random.shuffle(augmentations_lst)
@@ -404,6 +447,28 @@ class Augmenter(torch.nn.Module):
 
         return output, output_lengths
 
+    def get_cuda_streams(self, device, n_streams):
+        """Returns the CUDA streams used to run parallel augmentations.
+
+        The streams are created once per device and reused across calls.
+
+        Arguments
+        ---------
+        device : torch.device
+            The CUDA device of the streams.
+        n_streams : int
+            The number of streams needed.
+
+        Returns
+        -------
+        streams : list of torch.cuda.Stream
+            The CUDA streams.
+        """
+        streams = self.cuda_streams.setdefault(device, [])
+        while len(streams) < n_streams:
+            streams.append(torch.cuda.Stream(device=device))
+        return streams[:n_streams]
+
     def concatenate_outputs(self, augment_lst, augment_len_lst):
         """
         Concatenate a list of augmented signals, accounting for varying temporal lengths.
@@ -440,15 +505,22 @@ class Augmenter(torch.nn.Module):
             for length, output in zip(augment_len_lst, augment_lst)
         ]
 
-        # Pad sequences to match the maximum temporal dimension.
+        # Write the sequences into a single output tensor, zero-padding them to
+        # match the maximum temporal dimension.
         # Note that some augmented batches, like those with speed changes, may have different temporal dimensions.
-        augment_lst = [
-            F.pad(output, (0, max_len - output.shape[1]))
-            for output in augment_lst
-        ]
-
-        # Concatenate the padded sequences and rescaled lengths
-        output = torch.cat(augment_lst, dim=0)
+        batch_size = sum(augment.shape[0] for augment in augment_lst)
+        output = augment_lst[0].new_empty(
+            (batch_size, max_len, *augment_lst[0].shape[2:])
+        )
+        start = 0
+        for augment in augment_lst:
+            stop = start + augment.shape[0]
+            output[start:stop, : augment.shape[1]] = augment
+            if augment.shape[1] < max_len:
+                output[start:stop, augment.shape[1] :] = 0
+            start = stop
+
+        # Concatenate the rescaled lengths
         output_lengths = torch.cat(augment_len_lst, dim=0)
 
         return output, output_lengths
@@ -505,25 +577,37 @@ class Augmenter(torch.nn.Module):
         if not self.do_augment:
             return labels
 
-        augmented_labels = []
-        if self.concat_original and not (self.skip_concat):
-            augmented_labels = [
-                labels[self.concat_start_index : self.concat_end_index_batch]
-            ]
         selected_labels = labels[
             self.augment_start_index : self.augment_end_index_batch
         ]
 
-        if self.parallel_augment:
-            selected_labels = torch.cat(
-                [selected_labels] * self.N_augment, dim=0
-            )
+        # Each augmented example is replicated once per parallel augmentation
+        # (unless they share the batch) and once per repetition. The original
+        # labels (if concatenated) and the replicas are written into a single
+        # output tensor.
+        n_replicas = self.repeat_augment
+        if self.parallel_augment and not self.parallel_augment_fixed_bs:
+            n_replicas *= self.N_augment
 
-        augmented_labels = (
-            augmented_labels + [selected_labels] * self.repeat_augment
+        if self.concat_original and not (self.skip_concat):
+            original_labels = labels[
+                self.concat_start_index : self.concat_end_index_batch
+            ]
+        else:
+            if n_replicas == 1:
+                return selected_labels
+            original_labels = labels[:0]
+
+        n_original = original_labels.shape[0]
+        augmented_labels = labels.new_empty(
+            (
+                n_original + n_replicas * selected_labels.shape[0],
+                *labels.shape[1:],
+            )
         )
-
-        augmented_labels = torch.cat(augmented_labels, dim=0)
+        augmented_labels[:n_original] = original_labels
+        replica_shape = (n_replicas, *selected_labels.shape)
+        augmented_labels[n_original:].view(replica_shape).copy_(selected_labels)
 
         return augmented_labels
 
@@ -10,9 +10,153 @@ Authors:
 """
 
 import random
+from typing import Tuple
 
 import torch
 
+try:
+    import numba
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+@torch.jit.script
+def drop_chunks_params(
+    batch_size: int,
+    D: int,
+    chunk_idx: torch.Tensor,
+    drop_length_low: int,
+    drop_length_high: int,
+    drop_count_low: int,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Returns the random positions and lengths of the chunks to drop, as used
+    by SpectrogramDrop.
+
+    Each sample draws its number of chunks in [drop_count_low, len(chunk_idx)]
+    and the length of each chunk in [drop_length_low, drop_length_high). All
+    the samples draw len(chunk_idx) chunks, and the ones in excess of their
+    count get a zero length, so the whole batch is handled at once. The index
+    math is done in int32.
+
+    Arguments
+    ---------
+    batch_size : int
+        The number of samples to draw chunks for.
+    D : int
+        The size of the masked dimension.
+    chunk_idx : torch.Tensor
+        The int32 range [0, drop_count_high).
+    drop_length_low : int
+        The low end of lengths of the chunks.
+    drop_length_high : int
+        The high end of lengths of the chunks.
+    drop_count_low : int
+        The low end of number of chunks.
+
+    Returns
+    -------
+    mask_pos : torch.Tensor
+        The int32 start of the chunks, with shape `[batch, drop_count_high]`.
+    mask_len : torch.Tensor
+        The int32 length of the chunks, with shape `[batch, drop_count_high]`.
+    """
+    drop_count_high = chunk_idx.shape[0]
+
+    # A single random draw provides, for each sample, the number of chunks,
+    # their lengths and their positions, mapped to their ranges with a
+    # modulo (the bias is negligible for such small ranges).
+    rand = torch.randint(
+        0,
+        1 << 30,
+        [batch_size, 2 * drop_count_high + 1],
+        dtype=torch.int32,
+        device=chunk_idx.device,
+    )
+
+    # Number of chunks to drop for each sample
+    count_range = drop_count_high - drop_count_low + 1
+    n_masks = rand[:, :1] % count_range + drop_count_low
+
+    # Lengths of the chunks to drop
+    length_range = max(1, drop_length_high - drop_length_low)
+    mask_len = rand[:, 1 : drop_count_high + 1] % length_range
+    mask_len = mask_len + drop_length_low
+    mask_len = mask_len.masked_fill_(chunk_idx >= n_masks, 0)
+
+    # Positions of the chunks to drop, such that they fit in the masked
+    # dimension (the bound only depends on the hyperparameters, so there is
+    # no reduction over the lengths)
+    mask_pos = rand[:, drop_count_high + 1 :] % max(1, D - drop_length_high)
+
+    return mask_pos, mask_len
+
+
+@torch.jit.script
+def drop_chunks_mask(
+    arange: torch.Tensor, mask_pos: torch.Tensor, mask_len: torch.Tensor
+) -> torch.Tensor:
+    """Returns the mask of the chunks drawn by drop_chunks_params.
+
+    Arguments
+    ---------
+    arange : torch.Tensor
+        The int32 range [0, D), where D is the size of the masked dimension.
+    mask_pos : torch.Tensor
+        The start of the chunks, with shape `[batch, n_chunks]`.
+    mask_len : torch.Tensor
+        The length of the chunks, with shape `[batch, n_chunks]`.
+
+    Returns
+    -------
+    mask : torch.Tensor
+        Boolean mask of shape `[batch, D]`, True on the dropped chunks.
+    """
+    batch_size = mask_pos.shape[0]
+    D = arange.shape[0]
+
+    # Compute the mask for the selected chunk positions. The chunks are
+    # added one at a time to avoid a (batch, n_masks, D) intermediate.
+    mask = torch.zeros(batch_size, D, dtype=torch.bool, device=arange.device)
+    for i in range(mask_pos.shape[1]):
+        offset = arange - mask_pos[:, i : i + 1]
+        mask.logical_or_((offset >= 0) & (offset < mask_len[:, i : i + 1]))
+
+    return mask
+
+
+if NUMBA_AVAILABLE:
+
+    @numba.njit(cache=True)
+    def drop_chunks_numba(x, mask_pos, mask_len, fill, dim):
+        """Fills in place the chunks of x drawn by drop_chunks_params.
+
+        This is the CPU path of SpectrogramDrop for the constant replacements,
+        which writes the chunks directly instead of building a mask.
+
+        Arguments
+        ---------
+        x : numpy.ndarray
+            Spectrogram of shape `[batch, time, fea]`, modified in place.
+        mask_pos : numpy.ndarray
+            The start of the chunks, with shape `[batch, n_chunks]`.
+        mask_len : numpy.ndarray
+            The length of the chunks, with shape `[batch, n_chunks]`.
+        fill : float
+            The value written in the chunks.
+        dim : int
+            The masked dimension of x (1 for time, 2 for frequency).
+        """
+        for b in range(x.shape[0]):
+            for m in range(mask_pos.shape[1]):
+                lo = mask_pos[b, m]
+                hi = lo + mask_len[b, m]
+                if dim == 1:
+                    x[b, lo:hi, :] = fill
+                else:
+                    x[b, :, lo:hi] = fill
+
 
 class SpectrogramDrop(torch.nn.Module):
     """This class drops slices of the input spectrogram.
@@ -44,7 +188,8 @@ class SpectrogramDrop(torch.nn.Module):
         - 'rand': Masked values are replaced with random numbers ranging between
                   the maximum and minimum values of the spectrogram.
         - 'cutcat': Masked values are replaced with chunks from other signals in the batch.
-        - 'swap': Masked values are replaced with other chunks from the same sentence.
+        - 'swap': Masked values are replaced with other chunks from the same sentence
+                  (shifted in time by a random amount for each sentence).
         - 'random_selection': A random selection among the approaches above.
     dim : int
         Corresponding dimension to mask. If dim=1, we apply time masking.
@@ -106,6 +251,10 @@ class SpectrogramDrop(torch.nn.Module):
                 f"Invalid 'replace' option. Select one of {', '.join(self.replace_opts)}"
             )
 
+        # Index ranges used to build the masks, one per device. Each range
+        # grows to the largest size requested and is sliced for smaller ones.
+        self.arange_cache = {}
+
     def forward(self, spectrogram):
         """
         Apply the DropChunk augmentation to the input spectrogram.
@@ -115,22 +264,23 @@ class SpectrogramDrop(torch.nn.Module):
         Arguments
         ---------
         spectrogram : torch.Tensor
-            Input spectrogram of shape `[batch, time, fea]`.
+            Input spectrogram of shape `[batch, time, fea]` or
+            `[batch, channel, time, fea]`.
 
         Returns
         -------
         torch.Tensor
-            Augmented spectrogram of shape `[batch, time, fea]`.
+            Augmented spectrogram, with the same shape as the input.
         """
 
-        # Manage 4D tensors
-        if spectrogram.dim() == 4:
-            spectrogram = spectrogram.view(
-                -1, spectrogram.shape[2], spectrogram.shape[3]
-            )
+        # Nothing to drop
+        if self.drop_count_high == 0 or self.drop_length_high == 0:
+            return spectrogram
 
-        # Get the batch size
-        batch_size, time_duration, fea_size = spectrogram.shape
+        # Get the batch size. With 4D inputs, each channel of each sample
+        # gets its own mask, which is broadcast on the spectrogram.
+        *batch_dims, time_duration, fea_size = spectrogram.shape
+        batch_size = spectrogram.shape[:-2].numel()
 
         # Managing masking dimensions
         if self.dim == 1:
@@ -138,46 +288,60 @@ class SpectrogramDrop(torch.nn.Module):
         else:
             D = fea_size
 
-        # Randomly select the number of chunks to drop (same for all samples in the batch)
-        n_masks = torch.randint(
-            low=self.drop_count_low,
-            high=self.drop_count_high + 1,
-            size=(1,),
-            device=spectrogram.device,
+        # Draw the chunks to drop
+        mask_pos, mask_len = drop_chunks_params(
+            batch_size,
+            D,
+            self.get_arange(self.drop_count_high, spectrogram.device),
+            self.drop_length_low,
+            self.drop_length_high,
+            self.drop_count_low,
         )
 
-        # Randomly sample the lengths of the chunks to drop
-        mask_len = torch.randint(
-            low=self.drop_length_low,
-            high=self.drop_length_high,
-            size=(batch_size, n_masks),
-            device=spectrogram.device,
-        ).unsqueeze(2)
-
-        # Randomly sample the positions of the chunks to drop
-        mask_pos = torch.randint(
-            0,
-            max(1, D, -mask_len.max()),
-            (batch_size, n_masks),
-            device=spectrogram.device,
-        ).unsqueeze(2)
-
-        # Compute the mask for the selected chunk positions
-        arange = torch.arange(D, device=spectrogram.device).view(1, 1, -1)
-        mask = (mask_pos <= arange) * (arange < (mask_pos + mask_len))
-        mask = mask.any(dim=1)
-        mask = mask.unsqueeze(2) if self.dim == 1 else mask.unsqueeze(1)
+        replace = self.replace
+        if replace == "random_selection":
+            replace = random.choice(self.replace_opts[:-1])
+
+        # On CPU (e.g. in the dataloader workers), the constant replacements
+        # are written directly in the chunks, which avoids the dispatch of
+        # the torch ops on such small inputs.
+        if (
+            NUMBA_AVAILABLE
+            and replace in ("zeros", "mean")
+            and spectrogram.device.type == "cpu"
+            and spectrogram.dtype in (torch.float32, torch.float64)
+            and spectrogram.is_contiguous()
+            and not spectrogram.requires_grad
+        ):
+            fill = 0.0
+            if replace == "mean":
+                fill = spectrogram[..., ::4, :].mean().item()
+            drop_chunks_numba(
+                spectrogram.view(batch_size, time_duration, fea_size).numpy(),
+                mask_pos.numpy(),
+                mask_len.numpy(),
+                fill,
+                self.dim,
+            )
+            return spectrogram
 
-        # Determine the value to replace the masked chunks (zero or mean of the spectrogram)
-        if self.replace == "random_selection":
-            self.replace = random.choice(self.replace_opts[:-1])
+        # Compute the mask of the chunks to drop
+        mask = drop_chunks_mask(
+            self.get_arange(D, spectrogram.device), mask_pos, mask_len
+        )
+        mask = mask.view(*batch_dims, D)
+        mask = mask.unsqueeze(-1) if self.dim == 1 else mask.unsqueeze(-2)
 
-        if self.replace == "zeros":
+        # Determine the value to replace the masked chunks. Each option reads
+        # and writes the spectrogram in a single masked_fill_ or where.
+        if replace == "zeros":
             spectrogram = spectrogram.masked_fill_(mask, 0.0)
-        elif self.replace == "mean":
-            mean = spectrogram.mean().detach()
+        elif replace == "mean":
+            # The fill value is estimated on one frame out of four, which
+            # avoids a full extra pass over the spectrogram.
+            mean = spectrogram[..., ::4, :].mean().detach()
             spectrogram = spectrogram.masked_fill_(mask, mean)
-        elif self.replace == "rand":
+        elif replace == "rand":
             max_spectrogram = spectrogram.max().detach()
             min_spectrogram = spectrogram.min().detach()
             rand_spectrogram = torch.rand_like(spectrogram)
@@ -185,26 +349,49 @@ class SpectrogramDrop(torch.nn.Module):
                 rand_spectrogram * (max_spectrogram - min_spectrogram)
                 + min_spectrogram
             )
-            mask = mask.float()
-            spectrogram = (1 - mask) * spectrogram + mask * rand_spectrogram
-        elif self.replace == "cutcat":
+            spectrogram = torch.where(mask, rand_spectrogram, spectrogram)
+        elif replace == "cutcat":
             rolled_spectrogram = torch.roll(spectrogram, shifts=1, dims=0)
-            mask = mask.float()
-            spectrogram = (1 - mask) * spectrogram + mask * rolled_spectrogram
-        elif self.replace == "swap":
+            spectrogram = torch.where(mask, rolled_spectrogram, spectrogram)
+        elif replace == "swap":
+            # Each sample (and channel) is rolled in time by its own shift
             shift = torch.randint(
-                low=1,
-                high=spectrogram.shape[1],
-                size=(1,),
-                device=spectrogram.device,
+                1, time_duration, (batch_size, 1), device=spectrogram.device
             )
-            rolled_spectrogram = torch.roll(
-                spectrogram, shifts=shift.item(), dims=1
+            time = self.get_arange(time_duration, spectrogram.device)
+            index = (time - shift).remainder(time_duration)
+            index = index.view(*batch_dims, time_duration, 1)
+            rolled_spectrogram = spectrogram.gather(
+                -2, index.expand(spectrogram.shape)
             )
-            mask = mask.float()
-            spectrogram = (1 - mask) * spectrogram + mask * rolled_spectrogram
+            spectrogram = torch.where(mask, rolled_spectrogram, spectrogram)
+
+        return spectrogram
 
-        return spectrogram.view(*spectrogram.shape)
+    def get_arange(self, size, device):
+        """Returns torch.arange(size) as int32 on the given device.
+
+        A single range is kept per device. It is only reallocated when a
+        larger size is requested, so variable lengths do not accumulate
+        device memory.
+
+        Arguments
+        ---------
+        size : int
+            The number of elements of the range.
+        device : torch.device
+            The device of the range.
+
+        Returns
+        -------
+        arange : torch.Tensor
+            The range [0, size).
+        """
+        arange = self.arange_cache.get(device)
+        if arange is None or arange.shape[0] < size:
+            arange = torch.arange(size, dtype=torch.int32, device=device)
+            self.arange_cache[device] = arange
+        return arange[:size]
 
 
 class Warping(torch.nn.Module):
@@ -212,7 +399,8 @@ class Warping(torch.nn.Module):
     Apply time or frequency warping to a spectrogram.
 
     If `dim=1`, time warping is applied; if `dim=2`, frequency warping is applied.
-    This implementation selects a center and a window length to perform warping.
+    This implementation selects a center and a window length to perform warping,
+    independently for each sample of the batch.
     It ensures that the temporal dimension remains unchanged by upsampling or
     downsampling the affected regions accordingly.
 
@@ -224,7 +412,8 @@ class Warping(torch.nn.Module):
     warp_window : int, optional
         The width of the warping window. Default is 5.
     warp_mode : str, optional
-        The interpolation mode for time warping. Default is "bicubic."
+        The interpolation mode for time warping ("bicubic", "bilinear" or
+        "nearest"). Default is "bicubic."
     dim : int, optional
         Dimension along which to apply warping (1 for time, 2 for frequency).
         Default is 1.
@@ -255,6 +444,12 @@ class Warping(torch.nn.Module):
         self.warp_mode = warp_mode
         self.dim = dim
 
+        self.warp_mode_opts = ["bicubic", "bilinear", "nearest"]
+        if self.warp_mode not in self.warp_mode_opts:
+            raise ValueError(
+                f"Invalid 'warp_mode' option. Select one of {', '.join(self.warp_mode_opts)}"
+            )
+
     def forward(self, spectrogram):
         """
         Apply warping to the input spectrogram.
@@ -270,54 +465,170 @@ class Warping(torch.nn.Module):
             Augmented spectrogram with shape `[batch, time, fea]`.
         """
 
-        # Set warping dimension
-        if self.dim == 2:
-            spectrogram = spectrogram.transpose(1, 2)
-
-        original_size = spectrogram.shape
+        # The warped axis is resampled directly, without transposing or
+        # reshaping the input, so the output keeps its memory layout.
+        # x: (Batch, Time, Freq) or (Batch, Channel, Time, Freq)
+        dim = self.dim if spectrogram.dim() == 3 else self.dim + 1
+        len_original = spectrogram.shape[dim]
         window = self.warp_window
 
-        # 2d interpolation requires 4D or higher dimension tensors
-        # x: (Batch, Time, Freq) -> (Batch, 1, Time, Freq)
-        if spectrogram.dim() == 3:
-            spectrogram = spectrogram.unsqueeze(1)
-
-        len_original = spectrogram.shape[2]
-        if len_original - window <= window:
-            return spectrogram.view(*original_size)
-
-        # Compute center and corresponding window
-        c = torch.randint(window, len_original - window, (1,))[0]
-        w = torch.randint(c - window, c + window, (1,))[0] + 1
-
-        # Update the left part of the spectrogram
-        left = torch.nn.functional.interpolate(
-            spectrogram[:, :, :c],
-            (w, spectrogram.shape[3]),
-            mode=self.warp_mode,
-            align_corners=True,
+        # Nothing to warp if the window is null or the input too short
+        if window == 0 or len_original - window <= window:
+            return spectrogram
+
+        # Compute the center and the corresponding window of each sample
+        device = spectrogram.device
+        batch_size = spectrogram.shape[0]
+        c = torch.randint(
+            window, len_original - window, (batch_size, 1), device=device
+        )
+        w = c + torch.randint(
+            -window + 1, window + 1, (batch_size, 1), device=device
         )
 
-        # Update the right part of the spectrogram.
-        # When the left part is expanded, the right part is compressed by the
+        # Source time position of each output frame. The left part [0, c) is
+        # stretched onto [0, w) and the right part [c, len) onto [w, len):
+        # when the left part is expanded, the right part is compressed by the
         # same factor, and vice versa.
-        right = torch.nn.functional.interpolate(
-            spectrogram[:, :, c:],
-            (len_original - w, spectrogram.shape[3]),
-            mode=self.warp_mode,
-            align_corners=True,
+        last = len_original - 1
+        time = torch.arange(len_original, device=device).view(1, -1)
+        c, w = c.float(), w.float()
+        src_left = time * (c - 1) / (w - 1).clamp(min=1)
+        src_right = c + (time - w) * (last - c) / (last - w).clamp(min=1)
+        src_time = torch.where(time < w, src_left, src_right)
+
+        # Both parts are resampled at once, along the warped axis only
+        return self.interpolate_time(spectrogram, src_time, dim)
+
+    def interpolate_time(self, spectrogram, src_time, dim=2):
+        """Samples the spectrogram at fractional positions along one axis.
+
+        Only the given axis is resampled, so the interpolation is computed in
+        1D from the neighboring frames (4 for "bicubic", 2 for "bilinear"
+        and 1 for "nearest"), with the borders replicated.
+
+        Arguments
+        ---------
+        spectrogram : torch.Tensor
+            Input spectrogram with shape `[batch, time, fea]` or
+            `[batch, channel, time, fea]`.
+        src_time : torch.Tensor
+            The position to sample for each output frame, with shape
+            `[batch, n_frames]`.
+        dim : int
+            The axis of the spectrogram to resample. Default is 2, the time
+            axis of 4D inputs.
+
+        Returns
+        -------
+        torch.Tensor
+            Resampled spectrogram, with n_frames frames along dim.
+        """
+        batch_size = spectrogram.shape[0]
+        last = spectrogram.shape[dim] - 1
+        out_shape = list(spectrogram.shape)
+        out_shape[dim] = src_time.shape[1]
+
+        # Shape that broadcasts the positions (or weights) along the axis
+        index_shape = [1] * spectrogram.dim()
+        index_shape[0] = batch_size
+        index_shape[dim] = -1
+
+        def get_frames(index, out=None):
+            index = index.clamp(0, last).view(index_shape)
+            index = index.expand(out_shape)
+            return torch.gather(spectrogram, dim, index, out=out)
+
+        if self.warp_mode == "nearest":
+            return get_frames(src_time.round().long())
+
+        start = src_time.floor()
+        t = src_time - start
+        if self.warp_mode == "bilinear":
+            offsets, weights = (0, 1), (1 - t, t)
+        else:
+            offsets, weights = (-1, 0, 1, 2), self.cubic_weights(t)
+
+        # The weighted frames are accumulated in place into a single output,
+        # and the frames of every tap are gathered into the same buffer. The
+        # positions are computed in float32, but the interpolation itself
+        # runs in the dtype of the input (e.g., fp16 or bf16). Autograd does
+        # not support the out= variants, so when the gradient is needed the
+        # frames are accumulated out of place.
+        requires_grad = spectrogram.requires_grad and torch.is_grad_enabled()
+        start = start.long()
+        output = self.new_empty_like_layout(spectrogram, out_shape).zero_()
+        if not requires_grad:
+            frames = self.new_empty_like_layout(spectrogram, out_shape)
+        for offset, weight in zip(offsets, weights):
+            weight = weight.to(spectrogram.dtype).view(index_shape)
+            if requires_grad:
+                frames = get_frames(start + offset)
+                output = output + frames * weight
+            else:
+                get_frames(start + offset, out=frames)
+                output.addcmul_(frames, weight)
+
+        return output
+
+    @staticmethod
+    def new_empty_like_layout(spectrogram, shape):
+        """Returns an empty tensor with the given shape, and with the dtype,
+        device and memory format (contiguous or channels last) of the input.
+
+        Arguments
+        ---------
+        spectrogram : torch.Tensor
+            The reference tensor.
+        shape : tuple
+            The shape of the new tensor.
+
+        Returns
+        -------
+        torch.Tensor
+            The new tensor.
+        """
+        memory_format = torch.contiguous_format
+        if (
+            spectrogram.dim() == 4
+            and not spectrogram.is_contiguous()
+            and spectrogram.is_contiguous(memory_format=torch.channels_last)
+        ):
+            memory_format = torch.channels_last
+        return torch.empty(
+            shape,
+            dtype=spectrogram.dtype,
+            device=spectrogram.device,
+            memory_format=memory_format,
         )
 
-        # Injecting the warped left and right parts.
-        spectrogram[:, :, :w] = left
-        spectrogram[:, :, w:] = right
-        spectrogram = spectrogram.view(*original_size)
+    @staticmethod
+    def cubic_weights(t, A=-0.75):
+        """Returns the weights of the cubic convolution kernel used by
+        PyTorch's bicubic interpolation, for the 4 frames around each
+        position.
 
-        # Transpose if freq warping is applied.
-        if self.dim == 2:
-            spectrogram = spectrogram.transpose(1, 2)
+        Arguments
+        ---------
+        t : torch.Tensor
+            The fractional part of the positions, in [0, 1).
+        A : float
+            The parameter of the cubic convolution kernel.
 
-        return spectrogram
+        Returns
+        -------
+        weights : tuple of torch.Tensor
+            The weights of the frames at offsets -1, 0, 1 and 2.
+        """
+        x1 = t + 1
+        x2 = 1 - t
+        x3 = 2 - t
+        return (
+            ((A * x1 - 5 * A) * x1 + 8 * A) * x1 - 4 * A,
+            ((A + 2) * t - (A + 3)) * t * t + 1,
+            ((A + 2) * x2 - (A + 3)) * x2 * x2 + 1,
+            ((A * x3 - 5 * A) * x3 + 8 * A) * x3 - 4 * A,
+        )
 
 
 class RandomShift(torch.nn.Module):
@@ -1814,13 +1814,17 @@ class Brain:
                     continue
                 old_values_list.append(module.require_backward_grad_sync)
                 module.require_backward_grad_sync = False
-            yield
-            i = 0
-            for module in self.modules.values():
-                if not hasattr(module, "require_backward_grad_sync"):
-                    continue
-                module.require_backward_grad_sync = old_values_list[i]
-                i += 1
+            # Restore the sync flags even if the step fails, otherwise the
+            # gradients would silently never be synced again.
+            try:
+                yield
+            finally:
+                i = 0
+                for module in self.modules.values():
+                    if not hasattr(module, "require_backward_grad_sync"):
+                        continue
+                    module.require_backward_grad_sync = old_values_list[i]
+                    i += 1
         else:
             yield
 
@@ -195,10 +195,18 @@ class TransducerBeamSearcher(torch.nn.Module):
             `transducer_greedy_decode` where you left off in a streaming
             context.
         """
-        hyp = {
-            "prediction": [[] for _ in range(tn_output.size(0))],
-            "logp_scores": [0.0 for _ in range(tn_output.size(0))],
-        }
+        # The decoding loop is kept free of host-device synchronizations:
+        # the prediction network (PN) is run on the whole batch at each step
+        # and its outputs are only kept for the sentences that emitted a
+        # non-blank token. The predictions are moved to the host at the end.
+        predictions = torch.full(
+            tn_output.shape[:2],
+            self.blank_id,
+            device=tn_output.device,
+            dtype=torch.long,
+        )
+        logp_scores = torch.zeros(tn_output.size(0), device=tn_output.device)
+
         # prepare BOS = Blank for the Prediction Network (PN)
         input_PN = (
             torch.ones(
@@ -226,37 +234,34 @@ class TransducerBeamSearcher(torch.nn.Module):
             logp_targets, positions = torch.max(
                 log_probs.squeeze(1).squeeze(1), dim=1
             )
-            # Batch hidden update
-            have_update_hyp = []
-            for i in range(positions.size(0)):
-                # Update hiddens only if
-                # 1- current prediction is non blank
-                if positions[i].item() != self.blank_id:
-                    hyp["prediction"][i].append(positions[i].item())
-                    hyp["logp_scores"][i] += logp_targets[i]
-                    input_PN[i][0] = positions[i]
-                    have_update_hyp.append(i)
-            if len(have_update_hyp) > 0:
-                # Select sentence to update
-                # And do a forward steps + generated hidden
-                (
-                    selected_input_PN,
-                    selected_hidden,
-                ) = self._get_sentence_to_update(
-                    have_update_hyp, input_PN, hidden
-                )
-                selected_out_PN, selected_hidden = self._forward_PN(
-                    selected_input_PN, self.decode_network_lst, selected_hidden
-                )
-                # update hiddens and out_PN
-                out_PN[have_update_hyp] = selected_out_PN
-                hidden = self._update_hiddens(
-                    have_update_hyp, selected_hidden, hidden
-                )
+            predictions[:, t_step] = positions
+
+            # Update hiddens only if current prediction is non blank
+            have_update_hyp = positions != self.blank_id
+            logp_scores += logp_targets.masked_fill(~have_update_hyp, 0.0)
+            input_PN = positions.unsqueeze(1).to(input_PN.dtype)
+            updated_out_PN, updated_hidden = self._forward_PN(
+                input_PN, self.decode_network_lst, hidden
+            )
+            out_PN = torch.where(
+                have_update_hyp.view(-1, 1, 1), updated_out_PN, out_PN
+            )
+            hidden = self._update_hiddens(
+                have_update_hyp, updated_hidden, hidden
+            )
+
+        # Single transfer of the [B, T] predictions to the host
+        hyp = {
+            "prediction": [
+                [token for token in tokens if token != self.blank_id]
+                for tokens in predictions.tolist()
+            ],
+            "logp_scores": logp_scores.cpu(),
+        }
 
         ret = (
             hyp["prediction"],
-            torch.Tensor(hyp["logp_scores"]).exp().mean(),
+            hyp["logp_scores"].exp().mean(),
             None,
             None,
         )
@@ -497,47 +502,15 @@ class TransducerBeamSearcher(torch.nn.Module):
             log_probs = self.softmax(logits)
         return log_probs, hs
 
-    def _get_sentence_to_update(self, selected_sentences, output_PN, hidden):
-        """Select and return the updated hiddens and output
-        from the Prediction Network.
-
-        Arguments
-        ---------
-        selected_sentences : list
-            List of updated sentences (indexes).
-        output_PN: torch.Tensor
-            Output tensor from prediction network (PN).
-        hidden : torch.Tensor
-            Optional: None, hidden tensor to be used for
-            recurrent layers in the prediction network.
-
-        Returns
-        -------
-        selected_output_PN: torch.Tensor
-            Outputs a logits tensor [B_selected,U, hiddens].
-        hidden_update_hyp: torch.Tensor
-            Selected hiddens tensor.
-        """
-
-        selected_output_PN = output_PN[selected_sentences, :]
-        # for LSTM hiddens (hn, hc)
-        if isinstance(hidden, tuple):
-            hidden0_update_hyp = hidden[0][:, selected_sentences, :]
-            hidden1_update_hyp = hidden[1][:, selected_sentences, :]
-            hidden_update_hyp = (hidden0_update_hyp, hidden1_update_hyp)
-        else:
-            hidden_update_hyp = hidden[:, selected_sentences, :]
-        return selected_output_PN, hidden_update_hyp
-
     def _update_hiddens(self, selected_sentences, updated_hidden, hidden):
         """Update hidden tensor by a subset of hidden tensor (updated ones).
 
         Arguments
         ---------
-        selected_sentences : list
-            List of index to be updated.
+        selected_sentences : torch.Tensor
+            Boolean mask of shape [batch] of the sentences to update.
         updated_hidden : torch.Tensor
-            Hidden tensor of the selected sentences for update.
+            Hidden tensor computed for the whole batch.
         hidden : torch.Tensor
             Hidden tensor to be updated.
 
@@ -547,12 +520,13 @@ class TransducerBeamSearcher(torch.nn.Module):
             Updated hidden tensor.
         """
 
+        mask = selected_sentences.view(1, -1, 1)
         if isinstance(hidden, tuple):
-            hidden[0][:, selected_sentences, :] = updated_hidden[0]
-            hidden[1][:, selected_sentences, :] = updated_hidden[1]
-        else:
-            hidden[:, selected_sentences, :] = updated_hidden
-        return hidden
+            return (
+                torch.where(mask, updated_hidden[0], hidden[0]),
+                torch.where(mask, updated_hidden[1], hidden[1]),
+            )
+        return torch.where(mask, updated_hidden, hidden)
 
     def _forward_PN(self, out_PN, decode_network_lst, hidden=None):
         """Compute forward-pass through a list of prediction network (PN) layers.
@@ -37,7 +37,7 @@ def pack_padded_sequence(inputs, lengths):
     -------
     The packed sequences.
     """
-    lengths = (lengths * inputs.size(1)).cpu()
+    lengths = (lengths * inputs.size(1)).round().cpu()
     return torch.nn.utils.rnn.pack_padded_sequence(
         inputs, lengths, batch_first=True, enforce_sorted=False
     )
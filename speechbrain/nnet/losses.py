@@ -22,11 +22,13 @@ import torch.nn.functional as F
 
 from speechbrain.dataio.dataio import length_to_mask
 from speechbrain.decoders.ctc import filter_ctc_output
+from speechbrain.utils.autocast import fwd_default_precision
 from speechbrain.utils.data_utils import unsqueeze_as
 
 logger = logging.getLogger(__name__)
 
 
+@fwd_default_precision(cast_inputs=torch.float32)
 def transducer_loss(
     logits,
     targets,
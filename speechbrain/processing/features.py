@@ -132,7 +132,10 @@ class STFT(torch.nn.Module):
             round((self.sample_rate / 1000.0) * self.hop_length)
         )
 
-        self.window = window_fn(self.win_length)
+        # Stored as a (non-persistent) buffer, so it moves with the module
+        self.register_buffer(
+            "window", window_fn(self.win_length), persistent=False
+        )
 
     def forward(self, x):
         """Returns the STFT generated from the input waveforms.
@@ -277,7 +280,9 @@ class ISTFT(torch.nn.Module):
         )
 
         # Create window using provided function
-        self.window = window_fn(self.win_length)
+        self.register_buffer(
+            "window", window_fn(self.win_length), persistent=False
+        )
 
     def forward(self, x, sig_length=None):
         """Returns the ISTFT generated from the input signal.
@@ -507,6 +512,14 @@ class Filterbank(torch.nn.Module):
         # Replicating for all the filters
         self.all_freqs_mat = all_freqs.repeat(self.f_central.shape[0], 1)
 
+        # Fixed filters are computed once, and then move with the module
+        if self.freeze:
+            self.register_buffer(
+                "fbank_matrix",
+                self._compute_fbank_matrix(perturb=False),
+                persistent=False,
+            )
+
     def forward(self, spectrogram):
         """Returns the FBANks.
 
@@ -519,6 +532,51 @@ class Filterbank(torch.nn.Module):
         -------
         fbanks : torch.Tensor
         """
+        perturb = self.param_rand_factor != 0 and self.training
+        if self.freeze and not perturb:
+            fbank_matrix = self.fbank_matrix
+        else:
+            fbank_matrix = self._compute_fbank_matrix(perturb)
+        fbank_matrix = fbank_matrix.to(spectrogram.device)
+
+        sp_shape = spectrogram.shape
+
+        # Managing multi-channels case (batch, time, channels)
+        if len(sp_shape) == 4:
+            spectrogram = spectrogram.permute(0, 3, 1, 2)
+            spectrogram = spectrogram.reshape(
+                sp_shape[0] * sp_shape[3], sp_shape[1], sp_shape[2]
+            )
+
+        # FBANK computation
+        fbanks = torch.matmul(spectrogram, fbank_matrix)
+        if self.log_mel:
+            fbanks = self._amplitude_to_DB(fbanks)
+
+        # Reshaping in the case of multi-channel inputs
+        if len(sp_shape) == 4:
+            fb_shape = fbanks.shape
+            fbanks = fbanks.reshape(
+                sp_shape[0], sp_shape[3], fb_shape[1], fb_shape[2]
+            )
+            fbanks = fbanks.permute(0, 2, 3, 1)
+
+        return fbanks
+
+    def _compute_fbank_matrix(self, perturb):
+        """Returns the matrix of the filters, computed from their central
+        frequencies and bands.
+
+        Arguments
+        ---------
+        perturb : bool
+            If True, the central frequencies and bands are randomly changed
+            (see param_rand_factor).
+
+        Returns
+        -------
+        fbank_matrix : torch.Tensor
+        """
         # Computing central frequency and bandwidth of each filter
         f_central_mat = self.f_central.repeat(
             self.all_freqs_mat.shape[1], 1
@@ -546,7 +604,7 @@ class Filterbank(torch.nn.Module):
             )
 
         # Regularization with random changes of filter central frequency and band
-        elif self.param_rand_factor != 0 and self.training:
+        elif perturb:
             rand_change = (
                 1.0
                 + torch.rand(2) * 2 * self.param_rand_factor
@@ -555,33 +613,7 @@ class Filterbank(torch.nn.Module):
             f_central_mat = f_central_mat * rand_change[0]
             band_mat = band_mat * rand_change[1]
 
-        fbank_matrix = self._create_fbank_matrix(f_central_mat, band_mat).to(
-            spectrogram.device
-        )
-
-        sp_shape = spectrogram.shape
-
-        # Managing multi-channels case (batch, time, channels)
-        if len(sp_shape) == 4:
-            spectrogram = spectrogram.permute(0, 3, 1, 2)
-            spectrogram = spectrogram.reshape(
-                sp_shape[0] * sp_shape[3], sp_shape[1], sp_shape[2]
-            )
-
-        # FBANK computation
-        fbanks = torch.matmul(spectrogram, fbank_matrix)
-        if self.log_mel:
-            fbanks = self._amplitude_to_DB(fbanks)
-
-        # Reshaping in the case of multi-channel inputs
-        if len(sp_shape) == 4:
-            fb_shape = fbanks.shape
-            fbanks = fbanks.reshape(
-                sp_shape[0], sp_shape[3], fb_shape[1], fb_shape[2]
-            )
-            fbanks = fbanks.permute(0, 2, 3, 1)
-
-        return fbanks
+        return self._create_fbank_matrix(f_central_mat, band_mat)
 
     @staticmethod
     def _to_mel(hz):
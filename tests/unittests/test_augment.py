@@ -449,6 +449,7 @@ def test_SpectrogramDrop():
     output = drop(spectrogram.clone())
     assert spectrogram.shape == output.shape
     assert not torch.equal(spectrogram, output)
+    assert drop.replace == "random_selection"
 
     from speechbrain.augment.codec import CodecAugment
 
@@ -491,6 +492,80 @@ def test_SpectrogramDrop():
     assert signal.shape == signal_dropped.shape
 
 
+def test_SpectrogramDrop_per_sample_masks():
+    from speechbrain.augment.freq_domain import SpectrogramDrop
+
+    spectrogram = torch.rand(8, 200, 40) + 1.0
+    drop = SpectrogramDrop(
+        drop_length_low=5,
+        drop_length_high=6,
+        drop_count_low=1,
+        drop_count_high=3,
+        replace="zeros",
+        dim=1,
+    )
+    output = drop(spectrogram.clone())
+
+    # Every sample gets between 1 and 3 chunks of 5 frames
+    dropped_frames = (output == 0).all(dim=2).sum(dim=1)
+    assert (dropped_frames >= 5).all()
+    assert (dropped_frames <= 15).all()
+    assert ((output == 0) | (output == spectrogram)).all()
+
+    # 4D inputs keep their shape
+    spectrogram = torch.rand(2, 3, 100, 40)
+    for replace in ["zeros", "mean", "cutcat", "swap"]:
+        drop = SpectrogramDrop(replace=replace, dim=2)
+        output = drop(spectrogram.clone())
+        assert output.shape == spectrogram.shape
+
+
+def test_Warping():
+    from speechbrain.augment.freq_domain import Warping
+
+    spectrogram = torch.rand(4, 100, 40)
+    original = spectrogram.clone()
+    for dim in [1, 2]:
+        warp = Warping(dim=dim)
+        output = warp(spectrogram)
+        assert output.shape == spectrogram.shape
+        assert output.is_contiguous()
+        assert torch.equal(spectrogram, original)
+
+    # Channels-last 4D inputs keep their memory format
+    spectrogram = torch.rand(2, 3, 100, 40)
+    spectrogram = spectrogram.to(memory_format=torch.channels_last)
+    output = Warping()(spectrogram)
+    assert output.shape == spectrogram.shape
+    assert output.is_contiguous(memory_format=torch.channels_last)
+
+    # The warping is differentiable
+    for mode in ["bicubic", "bilinear", "nearest"]:
+        spectrogram = torch.rand(4, 100, 40, requires_grad=True)
+        Warping(warp_mode=mode)(spectrogram).sum().backward()
+        assert spectrogram.grad.shape == spectrogram.shape
+
+    # Inputs that are too short are returned unchanged
+    spectrogram = torch.rand(4, 100, 8)
+    warp = Warping(warp_window=5, dim=2)
+    assert torch.equal(warp(spectrogram), spectrogram)
+
+    # The 1D time interpolation matches F.interpolate
+    spectrogram = torch.rand(2, 1, 30, 8)
+    src_time = torch.linspace(0, 29, 45).expand(2, -1)
+    for mode in ["bicubic", "bilinear"]:
+        warp = Warping(warp_mode=mode)
+        output = warp.interpolate_time(spectrogram, src_time)
+        expected = torch.nn.functional.interpolate(
+            spectrogram, (45, 8), mode=mode, align_corners=True
+        )
+        assert torch.allclose(output, expected, atol=1e-5)
+
+    # Resampling the last axis of a 3D input is the same interpolation
+    output = warp.interpolate_time(spectrogram[:, 0].mT, src_time, dim=2)
+    assert torch.allclose(output.mT, expected[:, 0], atol=1e-5)
+
+
 def test_augment_pipeline():
     from speechbrain.augment.augmenter import Augmenter
     from speechbrain.augment.time_domain import DropChunk, DropFreq
@@ -618,6 +693,8 @@ def test_augment_pipeline():
     assert len(output_signal) == 20
     assert len(lengths) == 20
     assert torch.equal(output_signal[0:4], signal[0:4])
+    labels = augment.replicate_labels(torch.arange(4))
+    assert torch.equal(labels, torch.arange(4).repeat(5))
 
     augment = Augmenter(
         parallel_augment=True,
@@ -648,3 +725,31 @@ def test_augment_pipeline():
         signal, lengths=torch.tensor([0.2, 0.5, 0.7, 1.0])
     )
     assert torch.equal(output_signal, signal)
+
+    augment = Augmenter(
+        parallel_augment=True,
+        parallel_augment_fixed_bs=True,
+        concat_original=True,
+        min_augmentations=2,
+        max_augmentations=2,
+        augmentations=[freq_dropper, chunk_dropper],
+    )
+
+    output_signal, lengths = augment(
+        signal, lengths=torch.tensor([0.2, 0.5, 0.7, 1.0])
+    )
+    assert len(output_signal) == 8
+    assert len(lengths) == 8
+    assert torch.equal(output_signal[0:4], signal[0:4])
+    assert torch.equal(lengths[4:], torch.tensor([0.2, 0.5, 0.7, 1.0]))
+    labels = augment.replicate_labels(torch.arange(4))
+    assert torch.equal(labels, torch.arange(4).repeat(2))
+
+    # Outputs with different temporal dimensions are zero-padded
+    output_signal, lengths = augment.concatenate_outputs(
+        [torch.ones(2, 10, 3), torch.ones(1, 5, 3)],
+        [torch.ones(2), torch.ones(1)],
+    )
+    assert output_signal.shape == (3, 10, 3)
+    assert torch.all(output_signal[2, 5:] == 0)
+    assert torch.equal(lengths, torch.tensor([1.0, 1.0, 0.5]))